@@ -2,62 +2,152 @@
 """
 Notion API Helper for Claude Code
 Requires: pip install requests
+Optional: pip install orjson (faster JSON encoding/decoding), brotli, uvloop
+Shares its HTTP session setup and JSON helpers with notion_integration.py
 """
 
 import os
 import sys
-import json
+import asyncio
+import dbm
+import functools
+import hashlib
+import pickle
+import shelve
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
+
+from notion_integration import (
+    BASE_HEADERS, MAX_PAGE_SIZE, append_children, create_session, json_dumps, json_loads, print_json
+)
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# On-disk cache for GET responses, kept in the per-user cache directory;
+# NOTION_CACHE_TTL=0 disables it
+CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "notion-claude", "responses"
+)
+CACHE_TTL = float(os.environ.get("NOTION_CACHE_TTL", 300))
+
+# Request bodies that never change, encoded once at import
+_LIST_DATABASES_BODY = json_dumps({"filter": {"property": "object", "value": "database"}})
+_SEARCH_PAGES_FILTER = json_dumps({"property": "object", "value": "page"})
+
+# Anything a missing, unwritable or corrupt shelve can raise; the cache then
+# behaves as a miss and the request goes to the API uncached
+_CACHE_ERRORS = (OSError, ValueError, EOFError, SyntaxError, pickle.UnpicklingError) + dbm.error
+
+class ResponseCache:
+    """Shelve-backed store of GET responses with their validators
+    
+    Best effort: I/O and decoding errors are treated as cache misses. The
+    shelve is not locked across processes, so concurrent CLI runs can lose
+    each other's entries (never corrupt a response, only drop it).
+    """
+    
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with self._lock, shelve.open(self.path) as cache:
+                return cache.get(key)
+        except _CACHE_ERRORS:
+            return None
+    
+    def put(self, key: str, body: Any, etag: Optional[str], last_modified: Optional[str]) -> None:
+        entry = {"time": time.time(), "etag": etag, "last_modified": last_modified, "body": body}
+        try:
+            with self._lock:
+                # Cached bodies are private page content: keep the directory
+                # and files readable by the owner only, tightening a
+                # directory left behind with default permissions
+                cache_dir = os.path.dirname(self.path)
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+                os.chmod(cache_dir, 0o700)
+                with shelve.Shelf(dbm.open(self.path, "c", 0o600)) as cache:
+                    cache[key] = entry
+        except _CACHE_ERRORS:
+            pass
+    
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry["time"] < self.ttl
 
 class NotionClient:
-    def __init__(self, token: str):
+    def __init__(self, token: str, cache_ttl: float = CACHE_TTL):
         self.token = token
         self.base_url = "https://api.notion.com/v1"
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28"
-        }
+        self.headers = {**BASE_HEADERS, "Authorization": f"Bearer {token}"}
+        self.session = create_session(self.headers)
+        self.cache = ResponseCache(CACHE_PATH, cache_ttl) if cache_ttl > 0 else None
+        # Cache keys are scoped per token, since access differs between integrations
+        self._cache_prefix = hashlib.sha256(token.encode()).hexdigest()[:16]
+    
+    def _cached_get(self, url: str) -> Dict:
+        """GET with a TTL cache, revalidating stale entries via ETag/Last-Modified"""
+        if self.cache is None:
+            return json_loads(self.session.get(url).content)
+        
+        key = f"{self._cache_prefix}:{url}"
+        entry = self.cache.get(key)
+        headers = {}
+        if entry:
+            if self.cache.is_fresh(entry):
+                return entry["body"]
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304 and entry:
+            body = entry["body"]
+        else:
+            body = json_loads(response.content)
+            if response.status_code != 200:
+                return body
+        self.cache.put(
+            key, body,
+            response.headers.get("ETag") or (entry and entry["etag"]),
+            response.headers.get("Last-Modified") or (entry and entry["last_modified"])
+        )
+        return body
     
     def search(self, query: str) -> Dict:
         """Search for pages and databases"""
-        data = {
-            "query": query,
-            "filter": {"property": "object", "value": "page"}
-        }
-        response = requests.post(
+        # Only the query string needs encoding; the filter is pre-encoded
+        body = b'{"query":' + json_dumps(query) + b',"filter":' + _SEARCH_PAGES_FILTER + b'}'
+        response = self.session.post(
             f"{self.base_url}/search",
-            headers=self.headers,
-            json=data
+            data=body
         )
-        return response.json()
+        return json_loads(response.content)
     
     def list_databases(self) -> Dict:
         """List all accessible databases"""
-        data = {"filter": {"property": "object", "value": "database"}}
-        response = requests.post(
+        response = self.session.post(
             f"{self.base_url}/search",
-            headers=self.headers,
-            json=data
+            data=_LIST_DATABASES_BODY
         )
-        return response.json()
+        return json_loads(response.content)
     
     def get_page(self, page_id: str) -> Dict:
         """Get page details"""
-        response = requests.get(
-            f"{self.base_url}/pages/{page_id}",
-            headers=self.headers
-        )
-        return response.json()
+        return self._cached_get(f"{self.base_url}/pages/{page_id}")
     
     def get_database(self, database_id: str) -> Dict:
         """Get database schema"""
-        response = requests.get(
-            f"{self.base_url}/databases/{database_id}",
-            headers=self.headers
-        )
-        return response.json()
+        return self._cached_get(f"{self.base_url}/databases/{database_id}")
     
     def query_database(self, database_id: str, filter_obj: Optional[Dict] = None) -> Dict:
         """Query a database with optional filters"""
@@ -65,12 +155,33 @@ class NotionClient:
         if filter_obj:
             data["filter"] = filter_obj
         
-        response = requests.post(
+        response = self.session.post(
             f"{self.base_url}/databases/{database_id}/query",
-            headers=self.headers,
             json=data
         )
-        return response.json()
+        return json_loads(response.content)
+    
+    def query_database_all(self, database_id: str, filter_obj: Optional[Dict] = None) -> Dict:
+        """Query a database and collect every result page"""
+        data = {"page_size": MAX_PAGE_SIZE}
+        if filter_obj:
+            data["filter"] = filter_obj
+        
+        results = []
+        while True:
+            response = self.session.post(
+                f"{self.base_url}/databases/{database_id}/query",
+                json=data
+            )
+            page = json_loads(response.content)
+            if response.status_code != 200:
+                return page
+            results.extend(page["results"])
+            if not page.get("has_more"):
+                break
+            data["start_cursor"] = page["next_cursor"]
+        
+        return {"object": "list", "results": results, "next_cursor": None, "has_more": False}
     
     def create_page(self, parent_id: str, title: str, parent_type: str = "database_id") -> Dict:
         """Create a new page"""
@@ -82,30 +193,87 @@ class NotionClient:
                 }
             }
         }
-        response = requests.post(
+        response = self.session.post(
             f"{self.base_url}/pages",
-            headers=self.headers,
             json=data
         )
-        return response.json()
+        return json_loads(response.content)
+    
+    def append_blocks(self, page_id: str, blocks: List[Dict]) -> Dict:
+        """Append blocks to a page, batching up to 100 children per request"""
+        return append_children(self.session, self.base_url, page_id, blocks)
     
     def append_block(self, page_id: str, content: str, block_type: str = "paragraph") -> Dict:
         """Append a block to a page"""
-        data = {
-            "children": [{
-                "object": "block",
-                "type": block_type,
-                block_type: {
-                    "rich_text": [{"type": "text", "text": {"content": content}}]
-                }
-            }]
-        }
-        response = requests.patch(
-            f"{self.base_url}/blocks/{page_id}/children",
-            headers=self.headers,
-            json=data
-        )
-        return response.json()
+        return self.append_blocks(page_id, [{
+            "object": "block",
+            "type": block_type,
+            block_type: {
+                "rich_text": [{"type": "text", "text": {"content": content}}]
+            }
+        }])
+
+class AsyncNotionClient:
+    """Async facade over NotionClient for fanning out calls with asyncio.gather"""
+
+    def __init__(self, token: str, max_concurrency: int = 16):
+        self.client = NotionClient(token)
+        # A dedicated pool, so concurrency does not depend on the size of the
+        # loop's default executor (min(32, cpu_count + 4) threads)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def __aenter__(self) -> "AsyncNotionClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+
+    async def search(self, query: str) -> Dict:
+        return await self._call(self.client.search, query)
+
+    async def list_databases(self) -> Dict:
+        return await self._call(self.client.list_databases)
+
+    async def get_page(self, page_id: str) -> Dict:
+        return await self._call(self.client.get_page, page_id)
+
+    async def get_database(self, database_id: str) -> Dict:
+        return await self._call(self.client.get_database, database_id)
+
+    async def query_database(self, database_id: str, filter_obj: Optional[Dict] = None) -> Dict:
+        return await self._call(self.client.query_database, database_id, filter_obj)
+
+    async def query_database_all(self, database_id: str, filter_obj: Optional[Dict] = None) -> Dict:
+        return await self._call(self.client.query_database_all, database_id, filter_obj)
+
+    async def create_page(self, parent_id: str, title: str, parent_type: str = "database_id") -> Dict:
+        return await self._call(self.client.create_page, parent_id, title, parent_type)
+
+    async def append_blocks(self, page_id: str, blocks: List[Dict]) -> Dict:
+        return await self._call(self.client.append_blocks, page_id, blocks)
+
+    async def append_block(self, page_id: str, content: str, block_type: str = "paragraph") -> Dict:
+        return await self._call(self.client.append_block, page_id, content, block_type)
+
+def run_async(coro):
+    """Run a coroutine to completion, on uvloop when it is installed"""
+    # uvloop.run() only exists from uvloop 0.18; older releases run on the
+    # default loop rather than touching the global event loop policy
+    if uvloop is not None and hasattr(uvloop, "run"):
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+async def get_pages(token: str, page_ids: List[str]) -> List[Dict]:
+    """Fetch several pages concurrently"""
+    async with AsyncNotionClient(token) as client:
+        return await asyncio.gather(*[client.get_page(page_id) for page_id in page_ids])
 
 def main():
     # Get token from environment
@@ -123,8 +291,10 @@ def main():
         print("  search <query>")
         print("  list-databases")
         print("  get-page <page_id>")
+        print("  get-pages <page_id> [page_id ...]")
         print("  get-database <database_id>")
         print("  query-database <database_id>")
+        print("  query-database-all <database_id>")
         print("  create-page <database_id> <title>")
         print("  append-block <page_id> <content>")
         sys.exit(1)
@@ -138,10 +308,14 @@ def main():
             result = client.list_databases()
         elif command == "get-page" and len(sys.argv) > 2:
             result = client.get_page(sys.argv[2])
+        elif command == "get-pages" and len(sys.argv) > 2:
+            result = run_async(get_pages(token, sys.argv[2:]))
         elif command == "get-database" and len(sys.argv) > 2:
             result = client.get_database(sys.argv[2])
         elif command == "query-database" and len(sys.argv) > 2:
             result = client.query_database(sys.argv[2])
+        elif command == "query-database-all" and len(sys.argv) > 2:
+            result = client.query_database_all(sys.argv[2])
         elif command == "create-page" and len(sys.argv) > 3:
             result = client.create_page(sys.argv[2], sys.argv[3])
         elif command == "append-block" and len(sys.argv) > 3:
@@ -150,9 +324,9 @@ def main():
             print(f"Invalid command or missing arguments: {command}")
             sys.exit(1)
         
-        print(json.dumps(result, indent=2))
+        print_json(result)
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"API Error: {e}")
         sys.exit(1)
 
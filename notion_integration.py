@@ -2,29 +2,214 @@
 """
 Notion Integration for Claude Code
 Automatically handles page creation and note management
+Requires: pip install requests
+Optional: pip install orjson (faster JSON encoding/decoding), brotli
 """
 
 import os
+import re
+import sys
 import json
-import requests
+import asyncio
+import functools
+import gzip
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
+from pathlib import Path
+from types import MappingProxyType
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Headers common to every request; only Authorization varies by token
+BASE_HEADERS = MappingProxyType({
+    "Content-Type": "application/json",
+    "Notion-Version": "2022-06-28"
+})
+
+# Notion accepts at most this many children per append request
+MAX_CHILDREN_PER_REQUEST = 100
+# ...and returns at most this many results per query page
+MAX_PAGE_SIZE = 100
+
+# Opt-in gzip of request bodies (NOTION_GZIP_REQUESTS=1); smaller bodies are
+# sent as is, since compressing them costs more than it saves
+GZIP_REQUESTS = os.environ.get("NOTION_GZIP_REQUESTS") == "1"
+GZIP_MIN_BYTES = 1024
+
+def json_loads(data: bytes) -> Any:
+    """Decode JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Encode JSON to UTF-8 bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+def print_json(obj: Any) -> None:
+    """Write obj to stdout as indented JSON, skipping the bytes -> str -> bytes round trip"""
+    sys.stdout.flush()
+    sys.stdout.buffer.write(json_dumps(obj, indent=True) + b"\n")
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rps` calls per second on average"""
+    
+    def __init__(self, rps: float = 3, burst: Optional[float] = None):
+        self.rate = rps
+        self.capacity = burst if burst is not None else rps
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a call may be made"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Take the token now, even if that overdraws the bucket, so later
+            # callers queue up behind this one
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+# Notion allows an average of 3 requests per second per integration, so all
+# clients in the process share one limiter
+RATE_LIMITER = RateLimiter(3)
+MAX_RATE_LIMIT_RETRIES = 5
+MAX_RETRY_DELAY = 30
+
+class NotionSession(requests.Session):
+    """Session that paces requests and retries them when rate limited (429)"""
+    
+    def __init__(self, rate_limiter: RateLimiter = RATE_LIMITER, gzip_requests: bool = GZIP_REQUESTS):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.gzip_requests = gzip_requests
+    
+    def request(self, method, url, *args, **kwargs):
+        # Encode json= payloads ourselves (orjson when available) rather than
+        # letting requests run them through the stdlib encoder; done once, so
+        # retries resend the same bytes
+        if kwargs.get("json") is not None:
+            kwargs["data"] = json_dumps(kwargs.pop("json"))
+            # requests only adds this header itself for json=, not data=
+            headers = kwargs.get("headers") or {}
+            if not any(k.lower() == "content-type" for k in headers) and "Content-Type" not in self.headers:
+                kwargs["headers"] = {**headers, "Content-Type": "application/json"}
+        data = kwargs.get("data")
+        if self.gzip_requests and isinstance(data, bytes) and len(data) > GZIP_MIN_BYTES:
+            kwargs["data"] = gzip.compress(data, compresslevel=1)
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "Content-Encoding": "gzip"}
+        delay = 1
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            try:
+                wait = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                wait = delay
+            time.sleep(min(wait, MAX_RETRY_DELAY))
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+def create_session(headers: Dict) -> requests.Session:
+    """Build a keep-alive, rate-limited session with pooled connections and retries"""
+    # requests already sends Accept-Encoding: gzip, deflate (plus br when the
+    # brotli package is installed) and decodes responses transparently
+    session = NotionSession()
+    session.headers.update(headers)
+    # 429s are handled by NotionSession for every method; these cover 5xx
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        raise_on_status=False
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+    return session
+
+def append_children(session: requests.Session, base_url: str, block_id: str, blocks: List[Dict]) -> Dict:
+    """Append blocks to a block or page, at most MAX_CHILDREN_PER_REQUEST per request
+    
+    On success, returns the last batch's list response with "results" holding
+    the children appended by every batch. On failure, returns Notion's error
+    object with an added "appended": n; the first n blocks were already added,
+    since earlier batches are not rolled back.
+    """
+    result = {"object": "list", "results": []}
+    results = []
+    for start in range(0, len(blocks), MAX_CHILDREN_PER_REQUEST):
+        response = session.patch(
+            f"{base_url}/blocks/{block_id}/children",
+            json={"children": blocks[start:start + MAX_CHILDREN_PER_REQUEST]}
+        )
+        if response.status_code != 200:
+            try:
+                error = json_loads(response.content)
+            except ValueError:
+                error = {"object": "error", "status": response.status_code, "message": response.text}
+            error["appended"] = start
+            return error
+        result = json_loads(response.content)
+        results.extend(result.get("results", []))
+    result["results"] = results
+    return result
+
+@functools.lru_cache(maxsize=1)
+def _load_config() -> Dict:
+    """Read notion_config.json once per process"""
+    return json_loads(Path(__file__).with_name("notion_config.json").read_bytes())
+
+def _mk_block(kind: str):
+    """Return a builder producing a `kind` block around a piece of text"""
+    skel = {"object": "block", "type": kind}
+    
+    def build(text: str) -> Dict:
+        block = skel.copy()
+        block[kind] = {"rich_text": [{"type": "text", "text": {"content": text}}]}
+        return block
+    
+    return build
+
+# Block builders used by _format_notes_as_blocks, keyed by paragraph kind
+_BUILDERS = {
+    "para": _mk_block("paragraph"),
+    "bullet": _mk_block("bulleted_list_item"),
+    "h1": _mk_block("heading_1"),
+    "h2": _mk_block("heading_2"),
+    "h3": _mk_block("heading_3"),
+}
+# Heading depth -> builder key; anything deeper than ## becomes h3
+_HEADING_KEYS = {1: "h1", 2: "h2"}
+# A "- " or "* " line with non-blank text after the marker; captures that text
+_BULLET_RE = re.compile(r'^[^\S\n]*[-*] ([^\S\n]*\S(?:.*\S)?)[^\S\n]*$', re.MULTILINE)
+_HEADING_RE = re.compile(r'#+')
 
 class NotionIntegration:
     def __init__(self):
-        # Load config
-        config_path = os.path.join(os.path.dirname(__file__), "notion_config.json")
-        with open(config_path, 'r') as f:
-            self.config = json.load(f)
+        self.config = _load_config()
         
         self.token = self.config["notion_api_token"]
         self.default_db = self.config["default_database_id"]
         self.base_url = "https://api.notion.com/v1"
-        self.headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28"
-        }
+        self.headers = {**BASE_HEADERS, "Authorization": f"Bearer {self.token}"}
+        self.session = create_session(self.headers)
     
     def create_page_with_notes(self, title: str, notes: str, tags: Optional[List[str]] = None) -> Dict:
         """Create a page with notes in the default database"""
@@ -44,31 +229,32 @@ class NotionIntegration:
             }
         }
         
-        response = requests.post(
+        response = self.session.post(
             f"{self.base_url}/pages",
-            headers=self.headers,
             json=page_data
         )
         
         if response.status_code != 200:
             return {"error": f"Failed to create page: {response.text}"}
         
-        page = response.json()
+        page = json_loads(response.content)
         page_id = page["id"]
         
-        # Add notes as blocks
+        # Add notes as blocks, batched to Notion's per-request children limit
         blocks = self._format_notes_as_blocks(notes)
         
-        block_data = {"children": blocks}
+        appended = append_children(self.session, self.base_url, page_id, blocks)
         
-        response = requests.patch(
-            f"{self.base_url}/blocks/{page_id}/children",
-            headers=self.headers,
-            json=block_data
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to add notes: {response.text}"}
+        if appended.get("object") == "error":
+            # The page exists and may hold some of the notes; say where it is
+            count = appended.pop("appended")
+            return {
+                "error": f"Failed to add notes: {json_dumps(appended).decode()}",
+                "page_id": page_id,
+                "url": page["url"],
+                "appended": count,
+                "total": len(blocks)
+            }
         
         return {
             "success": True,
@@ -78,120 +264,121 @@ class NotionIntegration:
             "message": f"Created page '{title}' with notes"
         }
     
+    async def create_pages_with_notes(self, items: List[Tuple[str, str, Optional[List[str]]]],
+                                      max_concurrency: int = 8) -> List[Dict]:
+        """Create several pages concurrently; results keep the order of items
+        
+        A failed item yields an {"error": ...} entry instead of aborting the
+        batch, so callers can tell exactly which pages were created.
+        """
+        loop = asyncio.get_running_loop()
+        
+        pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        try:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(pool, self.create_page_with_notes, title, notes, tags)
+                for title, notes, tags in items
+            ], return_exceptions=True)
+        finally:
+            pool.shutdown(wait=False)
+        
+        return [
+            {"error": f"Failed to create page '{item[0]}': {result}"}
+            if isinstance(result, Exception) else result
+            for item, result in zip(items, results)
+        ]
+    
     def _format_notes_as_blocks(self, notes: str) -> List[Dict]:
         """Convert notes string into Notion blocks"""
-        blocks = []
-        
         # Add timestamp
-        blocks.append({
-            "object": "block",
-            "type": "heading_3",
-            "heading_3": {
-                "rich_text": [{
-                    "type": "text",
-                    "text": {"content": f"Created by Claude Code - {datetime.now().strftime('%Y-%m-%d %H:%M')}"}
-                }]
-            }
-        })
+        stamp = f"Created by Claude Code - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        blocks = [_BUILDERS["h3"](stamp)]
+        build_bullet = _BUILDERS["bullet"]
         
         # Split notes by double newlines for paragraphs
-        paragraphs = notes.strip().split('\n\n')
-        
-        for para in paragraphs:
-            if para.strip():
-                # Check if it's a list
-                if para.strip().startswith('- ') or para.strip().startswith('* '):
-                    # Create bulleted list
-                    lines = para.strip().split('\n')
-                    for line in lines:
-                        if line.strip().startswith(('- ', '* ')):
-                            blocks.append({
-                                "object": "block",
-                                "type": "bulleted_list_item",
-                                "bulleted_list_item": {
-                                    "rich_text": [{
-                                        "type": "text",
-                                        "text": {"content": line.strip()[2:]}
-                                    }]
-                                }
-                            })
-                elif para.strip().startswith('#'):
-                    # Create heading
-                    level = len(para) - len(para.lstrip('#'))
-                    heading_type = f"heading_{min(level, 3)}"
-                    blocks.append({
-                        "object": "block",
-                        "type": heading_type,
-                        heading_type: {
-                            "rich_text": [{
-                                "type": "text",
-                                "text": {"content": para.strip('#').strip()}
-                            }]
-                        }
-                    })
-                else:
-                    # Create paragraph
-                    blocks.append({
-                        "object": "block",
-                        "type": "paragraph",
-                        "paragraph": {
-                            "rich_text": [{
-                                "type": "text",
-                                "text": {"content": para.strip()}
-                            }]
-                        }
-                    })
+        for raw in notes.strip().split('\n\n'):
+            para = raw.strip()
+            if not para:
+                continue
+            if para.startswith(('- ', '* ')):
+                # Bulleted list: one block per bullet line
+                blocks.extend(map(build_bullet, _BULLET_RE.findall(para)))
+                continue
+            if para.startswith('#'):
+                key = _HEADING_KEYS.get(_HEADING_RE.match(para).end(), "h3")
+                # Strip '#' from the unstripped paragraph: trailing whitespace
+                # shields a closing '#' (as in "C# "), as it always has
+                para = raw.strip('#').strip()
+            else:
+                key = "para"
+            blocks.append(_BUILDERS[key](para))
         
         return blocks
     
     def quick_note(self, content: str) -> Dict:
         """Create a quick note with auto-generated title"""
-        # Generate title from first line or date
-        lines = content.strip().split('\n')
-        if lines and len(lines[0]) < 100:
-            title = lines[0][:50] + "..." if len(lines[0]) > 50 else lines[0]
+        # Generate title from first line or date; only the first line is
+        # sliced out, so long notes aren't split into a list of lines
+        content_lstripped = content.lstrip()
+        nl = content_lstripped.find('\n')
+        first = (content_lstripped if nl == -1 else content_lstripped[:nl]).rstrip()
+        if len(first) < 100:
+            title = first[:50] + "..." if len(first) > 50 else first
         else:
             title = f"Quick Note - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
         
         return self.create_page_with_notes(title, content, ["DAILY", "PRODUCTIVITY"])
     
-    def list_recent_pages(self, limit: int = 5) -> Dict:
-        """List recent pages from the default database"""
+    def iter_recent_pages(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Yield summaries of pages in the default database, most recently edited first
+        
+        Results are fetched one API page (at most 100 rows) at a time, so only
+        that page is held in memory; raises RuntimeError if a query fails.
+        """
         data = {
             "sorts": [{"timestamp": "last_edited_time", "direction": "descending"}],
-            "page_size": limit
+            "page_size": MAX_PAGE_SIZE if limit is None else min(limit, MAX_PAGE_SIZE)
         }
+        remaining = limit
         
-        response = requests.post(
-            f"{self.base_url}/databases/{self.default_db}/query",
-            headers=self.headers,
-            json=data
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to list pages: {response.text}"}
-        
-        result = response.json()
-        pages = []
-        
-        for page in result["results"]:
-            title = "Untitled"
-            if page["properties"]["Page"]["title"]:
-                title = page["properties"]["Page"]["title"][0]["plain_text"]
+        while remaining is None or remaining > 0:
+            response = self.session.post(
+                f"{self.base_url}/databases/{self.default_db}/query",
+                json=data
+            )
             
-            pages.append({
-                "id": page["id"],
-                "title": title,
-                "url": page["url"],
-                "last_edited": page["last_edited_time"]
-            })
-        
-        return {"pages": pages}
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to list pages: {response.text}")
+            
+            result = json_loads(response.content)
+            for page in result["results"][:remaining]:
+                title = "Untitled"
+                if page["properties"]["Page"]["title"]:
+                    title = page["properties"]["Page"]["title"][0]["plain_text"]
+                
+                yield {
+                    "id": page["id"],
+                    "title": title,
+                    "url": page["url"],
+                    "last_edited": page["last_edited_time"]
+                }
+            
+            if not result.get("has_more"):
+                return
+            if remaining is not None:
+                remaining -= len(result["results"])
+                data["page_size"] = min(remaining, MAX_PAGE_SIZE)
+            data["start_cursor"] = result["next_cursor"]
+    
+    def list_recent_pages(self, limit: int = 5) -> Dict:
+        """List recent pages from the default database"""
+        try:
+            return {"pages": list(self.iter_recent_pages(limit))}
+        except RuntimeError as e:
+            return {"error": str(e)}
 
 # CLI interface
 if __name__ == "__main__":
-    import sys
-    
     notion = NotionIntegration()
     
     if len(sys.argv) < 2:
@@ -207,12 +394,12 @@ if __name__ == "__main__":
         title = sys.argv[2]
         notes = " ".join(sys.argv[3:])
         result = notion.create_page_with_notes(title, notes)
-        print(json.dumps(result, indent=2))
+        print_json(result)
     
     elif command == "quick" and len(sys.argv) >= 3:
         notes = " ".join(sys.argv[2:])
         result = notion.quick_note(notes)
-        print(json.dumps(result, indent=2))
+        print_json(result)
     
     elif command == "list":
         result = notion.list_recent_pages()
@@ -220,7 +407,7 @@ if __name__ == "__main__":
             for page in result["pages"]:
                 print(f"- {page['title']} ({page['id'][:8]}...)")
         else:
-            print(json.dumps(result, indent=2))
+            print_json(result)
     
     else:
         print(f"Unknown command: {command}")